@@ -11,13 +11,18 @@ and to add (animated) background images to QR codes.
 """
 from __future__ import absolute_import, unicode_literals, division
 import io
+import os
 import math
-from PIL import Image, ImageDraw, ImageSequence
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageChops, ImageColor, ImageSequence
 from segno import consts
 try:
-    from PIL.Image.Resampling import LANCZOS
+    from PIL.Image.Resampling import LANCZOS, NEAREST
 except ImportError:
-    from PIL.Image import LANCZOS
+    from PIL.Image import LANCZOS, NEAREST
 try:
     from PIL import UnidentifiedImageError
 except ImportError:
@@ -28,16 +33,51 @@ try:
     _SVG_SUPPORT = True
 except ImportError:
     pass
+_NUMPY_SUPPORT = False
+try:
+    import numpy as np
+    _NUMPY_SUPPORT = True
+except ImportError:
+    pass
+_VIPS_SUPPORT = False
+try:
+    import pyvips
+    _VIPS_SUPPORT = True
+except (ImportError, OSError):  # OSError: libvips not found
+    pass
 
 __version__ = '3.0.3.dev'
 
+# These modules are never replaced by the background image
+_KEEP_MODULES = (consts.TYPE_FINDER_PATTERN_DARK, consts.TYPE_FINDER_PATTERN_LIGHT, consts.TYPE_SEPARATOR,
+                 consts.TYPE_ALIGNMENT_PATTERN_DARK, consts.TYPE_ALIGNMENT_PATTERN_LIGHT, consts.TYPE_TIMING_DARK,
+                 consts.TYPE_TIMING_LIGHT)
+# Maps the alpha channel to a mask which selects all not fully transparent pixels
+_OPAQUE_LUT = [0] + [255] * 255
+# Name of the module color (without _dark / _light suffix) -> (dark type, light type)
+_NUMPY_MODULE_TYPES = {
+    'finder': (consts.TYPE_FINDER_PATTERN_DARK, consts.TYPE_FINDER_PATTERN_LIGHT),
+    'data': (consts.TYPE_DATA_DARK, consts.TYPE_DATA_LIGHT),
+    'version': (consts.TYPE_VERSION_DARK, consts.TYPE_VERSION_LIGHT),
+    'format': (consts.TYPE_FORMAT_DARK, consts.TYPE_FORMAT_LIGHT),
+    'alignment': (consts.TYPE_ALIGNMENT_PATTERN_DARK, consts.TYPE_ALIGNMENT_PATTERN_LIGHT),
+    'timing': (consts.TYPE_TIMING_DARK, consts.TYPE_TIMING_LIGHT),
+}
+# Names of all module color keyword arguments
+_NUMPY_COLOR_NAMES = (('dark', 'light', 'separator', 'dark_module', 'quiet_zone')
+                      + tuple(name + suffix for name in _NUMPY_MODULE_TYPES for suffix in ('_dark', '_light')))
+# Suffix of incomplete cache files
+_CACHE_TMP_SUFFIX = '.tmp'
+# Number of bands of a libvips image -> Pillow image mode
+_VIPS_MODES = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}
+
 
 def write_pil(qrcode, scale=1, border=None, dark='#000', light='#fff',
               finder_dark=False, finder_light=False, data_dark=False,
               data_light=False, version_dark=False, version_light=False,
               format_dark=False, format_light=False, alignment_dark=False,
               alignment_light=False, timing_dark=False, timing_light=False,
-              separator=False, dark_module=False, quiet_zone=False):
+              separator=False, dark_module=False, quiet_zone=False, cache=None):
     """\
     Converts the provided `qrcode` into a Pillow image.
 
@@ -75,35 +115,224 @@ def write_pil(qrcode, scale=1, border=None, dark='#000', light='#fff',
     :param separator: Color of the separator (default: same as ``light``)
     :param dark_module: Color of the dark module (default: same as ``dark``)
     :param quiet_zone: Color of the quiet zone modules (default: same as ``light``)
+    :param RenderCache cache: Optional cache which keeps the rendered images.
     """
+    colors = dict(dark=dark, light=light, finder_dark=finder_dark, finder_light=finder_light,
+                  data_dark=data_dark, data_light=data_light, version_dark=version_dark,
+                  version_light=version_light, format_dark=format_dark, format_light=format_light,
+                  alignment_dark=alignment_dark, alignment_light=alignment_light, timing_dark=timing_dark,
+                  timing_light=timing_light, separator=separator, dark_module=dark_module, quiet_zone=quiet_zone)
+    key = None
+    if cache is not None:
+        key = _cache_key(qrcode, dict(colors, writer='pil', scale=scale, border=border))
+        data = cache.get(key)
+        if data is not None:
+            return Image.open(io.BytesIO(data))
     # Cheating here ;) Let Segno write a PNG image and open it with Pillow
     # Versions < 1.0.0 used Pillow to draw the QR code but there was no benefit,
     # just duplicate code
     buff = io.BytesIO()
-    qrcode.save(buff, kind='png', scale=scale, border=border, dark=dark,
-                light=light, finder_dark=finder_dark, finder_light=finder_light,
-                data_dark=data_dark, data_light=data_light,
-                version_dark=version_dark, version_light=version_light,
-                format_dark=format_dark, format_light=format_light,
-                alignment_dark=alignment_dark, alignment_light=alignment_light,
-                timing_dark=timing_dark, timing_light=timing_light,
-                separator=separator, dark_module=dark_module, quiet_zone=quiet_zone)
+    qrcode.save(buff, kind='png', scale=scale, border=border, **colors)
+    if key is not None:
+        cache.put(key, buff.getvalue())
     buff.seek(0)
     return Image.open(buff)
 
 
+def write_numpy(qrcode, scale=1, border=None, dark='#000', light='#fff',
+                finder_dark=False, finder_light=False, data_dark=False,
+                data_light=False, version_dark=False, version_light=False,
+                format_dark=False, format_light=False, alignment_dark=False,
+                alignment_light=False, timing_dark=False, timing_light=False,
+                separator=False, dark_module=False, quiet_zone=False,
+                mode=None, out=None):
+    """\
+    Converts the provided `qrcode` into a NumPy array (dtype ``uint8``).
+
+    The array is created directly from the matrix, no image is encoded or
+    decoded.
+
+    The shape of the array is ``(height, width)`` for the modes "1" and
+    "L" and ``(height, width, 3)`` / ``(height, width, 4)`` for the modes
+    "RGB" / "RGBA". Mode "1" uses ``0`` for black and ``1`` for white.
+
+    See :py:func:`write_pil` for a description of the parameters which are
+    not mentioned here.
+
+    :param segno.QRCode qrcode: The QR code.
+    :param str mode: "1", "L", "RGB" or "RGBA". If set to ``None``
+            (default), the mode is determined by the colors: "1" for
+            black and white, "L" for other greyscale colors, "RGBA" if any
+            color is (semi-) transparent, otherwise "RGB".
+    :param numpy.ndarray out: Optional C-contiguous ``uint8`` array with the
+            expected shape which receives the result.
+    :rtype: numpy.ndarray
+    """
+    colors = dict(dark=dark, light=light, finder_dark=finder_dark, finder_light=finder_light,
+                  data_dark=data_dark, data_light=data_light, version_dark=version_dark,
+                  version_light=version_light, format_dark=format_dark, format_light=format_light,
+                  alignment_dark=alignment_dark, alignment_light=alignment_light, timing_dark=timing_dark,
+                  timing_light=timing_light, separator=separator, dark_module=dark_module, quiet_zone=quiet_zone)
+    lut, mode = _numpy_lut(colors, mode)
+    return _write_numpy(qrcode, int(scale), border, lut, mode, out)
+
+
+def write_numpy_batch(qrcodes, scale=1, border=None, mode=None, out=None, **kw):
+    """\
+    Converts the provided QR codes into one contiguous NumPy array
+    (dtype ``uint8``) of shape ``(len(qrcodes), ...)``.
+
+    All QR codes must have the same size (same version). See
+    :py:func:`write_numpy` for a description of the parameters,
+    the module colors are provided as keyword arguments.
+
+    :param qrcodes: Sequence of QR codes.
+    :rtype: numpy.ndarray
+    """
+    unknown = set(kw) - set(_NUMPY_COLOR_NAMES)
+    if unknown:
+        raise TypeError('write_numpy_batch() got unexpected keyword argument(s): {}'
+                        .format(', '.join(sorted(unknown))))
+    qrcodes = list(qrcodes)
+    if not qrcodes:
+        raise ValueError('At least one QR code is required')
+    scale = int(scale)
+    symbol_size = qrcodes[0].symbol_size(scale=scale, border=border)
+    if any(qrcode.symbol_size(scale=scale, border=border) != symbol_size for qrcode in qrcodes):
+        raise ValueError('All QR codes must have the same size')
+    lut, mode = _numpy_lut(kw, mode)
+    width, height = symbol_size
+    shape = (len(qrcodes), height, width) + (() if lut.ndim == 1 else lut.shape[1:])
+    out = _check_out(out, shape)
+    for qrcode, arr in zip(qrcodes, out):
+        _write_numpy(qrcode, scale, border, lut, mode, arr)
+    return out
+
+
+def _numpy_lut(colors, mode):
+    """\
+    Returns a tuple (lut, mode). The lookup table maps module types to
+    pixel values of the provided mode.
+
+    :param dict colors: Module colors (see :py:func:`write_numpy`).
+    :param mode: "1", "L", "RGB", "RGBA" or ``None`` (determine the mode
+            by the colors).
+    """
+    if mode not in (None, '1', 'L', 'RGB', 'RGBA'):
+        raise ValueError('Unsupported mode "{}". Supported: "1", "L", "RGB", "RGBA"'.format(mode))
+    dark, light = colors.get('dark', '#000'), colors.get('light', '#fff')
+    mt2color = {}
+    for name, (dark_type, light_type) in _NUMPY_MODULE_TYPES.items():
+        color = colors.get(name + '_dark', False)
+        mt2color[dark_type] = color if color is not False else dark
+        color = colors.get(name + '_light', False)
+        mt2color[light_type] = color if color is not False else light
+    for name, mt, default in (('separator', consts.TYPE_SEPARATOR, light),
+                              ('dark_module', consts.TYPE_DARKMODULE, dark),
+                              ('quiet_zone', consts.TYPE_QUIET_ZONE, light)):
+        color = colors.get(name, False)
+        mt2color[mt] = color if color is not False else default
+    mt2rgba = {}
+    for mt, color in mt2color.items():
+        # None: transparent
+        mt2rgba[mt] = (0, 0, 0, 0) if color is None else _color_to_rgba(color)
+    if mode is None:
+        rgbas = set(mt2rgba.values())
+        if any(a != 255 for r, g, b, a in rgbas):
+            mode = 'RGBA'
+        elif any(not r == g == b for r, g, b, a in rgbas):
+            mode = 'RGB'
+        elif rgbas <= {(0, 0, 0, 255), (255, 255, 255, 255)}:
+            mode = '1'
+        else:
+            mode = 'L'
+    channels = {'RGB': 3, 'RGBA': 4}.get(mode)
+    lut = np.zeros((max(mt2rgba) + 1,) + ((channels,) if channels else ()), dtype=np.uint8)
+    for mt, (r, g, b, a) in mt2rgba.items():
+        if mode in ('1', 'L'):
+            # ITU-R 601-2 luma transform, like Pillow
+            luma = (r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16
+            lut[mt] = luma if mode == 'L' else luma >= 128
+        else:
+            lut[mt] = (r, g, b, a)[:channels]
+    return lut, mode
+
+
+def _color_to_rgba(color):
+    """\
+    Returns the color as (R, G, B, A) tuple of integers.
+
+    :param color: A ``(R, G, B)`` or ``(R, G, B, A)`` tuple (the alpha
+            value may be a float between ``0`` and ``1``), a hexadecimal
+            color (``#RGB``, ``#RGBA``, ``#RRGGBB``, ``#RRGGBBAA``, the
+            ``#`` is optional) or a web color name.
+    """
+    if isinstance(color, tuple):
+        if len(color) not in (3, 4) or not all(0 <= c <= 255 for c in color):
+            raise ValueError('Unsupported color "{}"'.format(color))
+        alpha = color[3] if len(color) == 4 else 255
+        if isinstance(alpha, float):
+            if alpha > 1.0:
+                raise ValueError('Invalid alpha channel value: {}'.format(alpha))
+            alpha = int(round(alpha * 255))
+        return tuple(int(c) for c in color[:3]) + (alpha,)
+    try:
+        return ImageColor.getcolor(color, 'RGBA')
+    except ValueError:
+        try:
+            return ImageColor.getcolor('#' + color, 'RGBA')
+        except ValueError:
+            raise ValueError('Unsupported color "{}". Neither a known web color name nor a color in '
+                             'hexadecimal format.'.format(color))
+
+
+def _write_numpy(qrcode, scale, border, lut, mode, out):
+    """\
+    Writes the QR code into `out` (or a new array) and returns the array.
+
+    The module types are read once (unscaled) and expanded to the pixel
+    resolution via broadcasting.
+    """
+    types = np.array(list(qrcode.matrix_iter(scale=1, border=border, verbose=True)), dtype=np.intp)
+    height, width = types.shape
+    pixels = lut[types]
+    channels = pixels.shape[2:]
+    out = _check_out(out, (height * scale, width * scale) + channels)
+    out.reshape((height, scale, width, scale) + channels)[...] = pixels[:, np.newaxis, :, np.newaxis]
+    return out
+
+
+def _check_out(out, shape):
+    """\
+    Returns `out` or a new array if `out` is ``None``.
+    """
+    if out is None:
+        return np.empty(shape, dtype=np.uint8)
+    if out.shape != shape or out.dtype != np.uint8 or not out.flags.c_contiguous:
+        raise ValueError('Expected a C-contiguous uint8 array of shape {}, got {} array of shape {}'
+                         .format(shape, out.dtype, out.shape))
+    return out
+
+
 def write_artistic(qrcode, background, target, mode=None, format=None, kind=None,
                    scale=3, border=None, dark='#000', light='#fff',
                    finder_dark=False, finder_light=False, data_dark=False,
                    data_light=False, version_dark=False, version_light=False,
                    format_dark=False, format_light=False, alignment_dark=False,
                    alignment_light=False, timing_dark=False, timing_light=False,
-                   separator=False, dark_module=False, quiet_zone=False):
+                   separator=False, dark_module=False, quiet_zone=False, workers=None,
+                   cache=None, backend=None):
     """\
     Saves the QR code with the background image into target.
 
     :param segno.QRCode qrcode: The QR code.
-    :param background: Path to the background image.
+    :param background: The background image. Either a filename, a readable
+            file-like object, the image content as :py:class:`bytes`,
+            :py:class:`bytearray` or :py:class:`memoryview` (a
+            non-contiguous memoryview is copied), an already
+            loaded :py:class:`PIL.Image.Image` (which may have multiple
+            frames) or an object which provides the NumPy array interface
+            (i.e. a :py:class:`numpy.ndarray`).
     :param target: A filename or a writable file-like object with a
                     ``name`` attribute. Use the ``kind`` parameter if
                     `target` is a :py:class:`io.BytesIO` stream which does not
@@ -139,31 +368,25 @@ def write_artistic(qrcode, background, target, mode=None, format=None, kind=None
     :param separator: Color of the separator (default: same as ``light``)
     :param dark_module: Color of the dark module (default: same as ``dark``)
     :param quiet_zone: Color of the quiet zone modules (default: same as ``light``)
+    :param int workers: Number of threads which process the frames of an
+            animated background in parallel. If set to ``None`` (default)
+            or ``1``, the frames are processed sequentially. ``0`` uses
+            as many threads as CPUs are available.
+    :param RenderCache cache: Optional cache which keeps the rendered images.
+            If the cache contains an image for the provided QR code,
+            background and parameters, the image is copied into `target`
+            without rendering it again.
+    :param backend: The image processing backend, either a :py:class:`Backend`
+            instance or the name of a backend ("pillow" or "vips").
+            If ``None`` (default), the default backend is used
+            (see :py:func:`set_default_backend`).
     """
     scale = int(scale)
-    requested_scale = scale
-    while scale % 3:
-        scale += 1
-    qr_img = write_pil(qrcode, scale=scale, border=border, dark=dark, light=light, finder_dark=finder_dark,
-                       finder_light=finder_light, data_dark=data_dark, data_light=data_light, version_dark=version_dark,
-                       version_light=version_light, format_dark=format_dark, format_light=format_light,
-                       alignment_dark=alignment_dark, alignment_light=alignment_light, timing_dark=timing_dark,
-                       timing_light=timing_light, separator=separator, dark_module=dark_module,
-                       quiet_zone=quiet_zone).convert('RGBA')
-    # Maximal dimensions of the background image(s)
-    # The background image is not drawn at the quiet zone of the QR Code, therefore border=0
-    max_bg_width, max_bg_height = qrcode.symbol_size(scale=scale, border=0)
+    backend = _get_backend(backend)
     if format:
         import warnings
         warnings.warn('Using format is deprecated, use "kind"', DeprecationWarning)
         kind = format
-    try:
-        bg_img = Image.open(background)
-    except UnidentifiedImageError:
-        bg_img = _svg_to_png(background, width=max_bg_width, height=max_bg_height)
-    input_mode = bg_img.mode
-    bg_images = [bg_img]
-    is_animated = False
     if kind is None:
         try:
             fname = target.name
@@ -172,92 +395,691 @@ def write_artistic(qrcode, background, target, mode=None, format=None, kind=None
         ext = fname[fname.rfind('.') + 1:].lower()
     else:
         ext = kind.lower()
-    target_supports_animation = ext in ('gif', 'png', 'webp')
-    try:
-        is_animated = target_supports_animation and bg_img.is_animated
-    except AttributeError:
-        pass
-    durations = None
-    loop = 0
-    if is_animated:
-        loop = bg_img.info.get('loop', 0)
-        bg_images = [frame.copy() for frame in ImageSequence.Iterator(bg_img)]
-        durations = [img.info.get('duration', 0) for img in bg_images]
+    colors = dict(dark=dark, light=light, finder_dark=finder_dark, finder_light=finder_light,
+                  data_dark=data_dark, data_light=data_light, version_dark=version_dark,
+                  version_light=version_light, format_dark=format_dark, format_light=format_light,
+                  alignment_dark=alignment_dark, alignment_light=alignment_light, timing_dark=timing_dark,
+                  timing_light=timing_light, separator=separator, dark_module=dark_module, quiet_zone=quiet_zone)
+    if cache is not None:
+        if hasattr(background, 'read'):
+            # The content is needed for the key and (maybe) for rendering
+            background = background.read()
+        key = _cache_key(qrcode, dict(colors, writer='artistic', backend=backend.name, mode=mode, kind=ext,
+                                      scale=scale, border=border), background)
+        if cache.copy(key, target):
+            return
+        buff = io.BytesIO()
+        write_artistic(qrcode, background, buff, mode=mode, kind=ext, scale=scale, border=border, workers=workers,
+                       backend=backend, **colors)
+        cache.put(key, buff.getvalue())
+        if hasattr(target, 'write'):
+            target.write(buff.getvalue())
+        else:
+            with open(target, 'wb') as f:
+                f.write(buff.getvalue())
+        return
+    requested_scale = scale
+    while scale % 3:
+        scale += 1
+    qr_img = backend.from_pil(write_pil(qrcode, scale=scale, border=border, **colors).convert('RGBA'))
+    # Maximal dimensions of the background image(s)
+    # The background image is not drawn at the quiet zone of the QR Code, therefore border=0
+    max_bg_width, max_bg_height = qrcode.symbol_size(scale=scale, border=0)
+    target_supports_animation = ext in backend.animation_formats
+    bg_images, input_mode, durations, loop = backend.decode(background, width=max_bg_width, height=max_bg_height,
+                                                            animated=target_supports_animation)
     border = border if border is not None else qrcode.default_border_size
-    bg_width, bg_height = bg_images[0].size
+    bg_width, bg_height = backend.size(bg_images[0])
     ratio = min(max_bg_width / bg_width, max_bg_height / bg_height)
     bg_width, bg_height = int(bg_width * ratio), int(bg_height * ratio)
-    bg_tpl = Image.new('RGBA', (max_bg_width, max_bg_height), (255, 0, 0, 0))
-    tmp_bg_images = []
-    for img in (img.resize((bg_width, bg_height), LANCZOS) for img in bg_images):
-        bg_img = bg_tpl.copy()
-        tmp_bg_images.append(bg_img)
-        pos = (int(math.ceil((max_bg_width - img.size[0]) / 2)), int(math.ceil((max_bg_height - img.size[1]) / 2)))
-        bg_img.paste(img, pos)
-    bg_images = tmp_bg_images
-    res_images = [qr_img]
-    res_images.extend(qr_img.copy() for _ in range(len(bg_images) - 1))
-    # Cache drawing functions of the result image(s)
-    draw_functions = [ImageDraw.Draw(img).point for img in res_images]
-    keep_modules = (consts.TYPE_FINDER_PATTERN_DARK, consts.TYPE_FINDER_PATTERN_LIGHT, consts.TYPE_SEPARATOR,
-                    consts.TYPE_ALIGNMENT_PATTERN_DARK, consts.TYPE_ALIGNMENT_PATTERN_LIGHT, consts.TYPE_TIMING_DARK,
-                    consts.TYPE_TIMING_LIGHT)
+    bg_tpl = backend.from_pil(Image.new('RGBA', (max_bg_width, max_bg_height), (255, 0, 0, 0)))
+    bg_pos = (int(math.ceil((max_bg_width - bg_width) / 2)), int(math.ceil((max_bg_height - bg_height) / 2)))
     border_offset = border * scale
-    d = scale // 3
-    for i, row in enumerate(qrcode.matrix_iter(scale=scale, border=0, verbose=True)):
-        for j, m in enumerate(row):
-            if m in keep_modules:
-                continue
-            if not (((i // d) % 3 == 1) and ((j // d) % 3 == 1)):
-                for img_idx, img in enumerate(bg_images):
-                    fill = img.getpixel((i, j))
-                    if fill[3]:
-                        draw_functions[img_idx]((i + border_offset, j + border_offset), fill)
+    mask = backend.from_pil(_background_mask(qrcode, scale))
+    res_size = None
     if scale != requested_scale:
-        bg_width, bg_height = max_bg_width, max_bg_height
-        max_bg_width, max_bg_height = qrcode.symbol_size(scale=requested_scale, border=border)
-        ratio = min(max_bg_width / bg_width, max_bg_height / bg_height)
-        bg_width, bg_height = int(bg_width * ratio), int(bg_height * ratio)
-        res_images = [img.resize((bg_width, bg_height), LANCZOS) for img in res_images]
+        width, height = qrcode.symbol_size(scale=requested_scale, border=border)
+        ratio = min(width / max_bg_width, height / max_bg_height)
+        res_size = int(max_bg_width * ratio), int(max_bg_height * ratio)
     if mode is None and input_mode != 'RGBA':
-        res_images = [img.convert(input_mode) for img in res_images]
-    elif mode is not None:
-        res_images = [img.convert(mode) for img in res_images]
-    if is_animated:
-        res_images[0].save(target, format=kind, duration=durations, save_all=True, append_images=res_images[1:],
-                           loop=loop)
+        mode = input_mode
+
+    def compose(img):
+        bg_img = backend.composite(bg_tpl, backend.resize(img, (bg_width, bg_height)), bg_pos)
+        res_img = backend.composite(qr_img, bg_img, (border_offset, border_offset), mask)
+        if res_size is not None:
+            res_img = backend.resize(res_img, res_size)
+        if mode is not None:
+            res_img = backend.convert(res_img, mode)
+        return res_img
+
+    if workers is not None and workers != 1 and len(bg_images) > 1:
+        # Pillow and libvips release the GIL while resizing / compositing, threads are sufficient
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            res_images = list(executor.map(compose, bg_images))
     else:
-        res_images[0].save(target, format=kind)
+        res_images = [compose(img) for img in bg_images]
+    backend.encode(res_images, target, ext, durations=durations, loop=loop)
+
+
+class Backend(object):
+    """\
+    Interface of the image processing backends used by `write_artistic`.
+
+    Images are opaque objects of the backend, i.e. :py:class:`PIL.Image.Image`
+    instances for the :py:class:`PillowBackend`.
+    """
+    #: Name of the backend, used to select the backend by name.
+    name = None
+    #: Image formats (file extensions) which support animations.
+    animation_formats = ()
+
+    def decode(self, background, width, height, animated):
+        """\
+        Loads the background image.
+
+        :param background: The background (see `write_artistic`).
+        :param int width: The max. width of the background (used for SVG images).
+        :param int height: The max. height of the background (used for SVG images).
+        :param bool animated: Indicates if all frames of an animated
+                background should be returned.
+        :return: A tuple (frames, mode, durations, loop). `mode` is the
+                Pillow image mode of the background, `durations` is ``None``
+                if the background is not animated (or `animated` is ``False``).
+        """
+        raise NotImplementedError()
+
+    def from_pil(self, img):
+        """\
+        Converts a Pillow image (mode "L" or "RGBA") into an image of this backend.
+        """
+        raise NotImplementedError()
+
+    def size(self, img):
+        """\
+        Returns the (width, height) tuple of the image.
+        """
+        raise NotImplementedError()
+
+    def resize(self, img, size):
+        """\
+        Returns the image resized to the provided (width, height) (Lanczos filter).
+        """
+        raise NotImplementedError()
+
+    def composite(self, img, overlay, pos, mask=None):
+        """\
+        Returns a copy of `img` where the area at `pos` is replaced by `overlay`.
+
+        If a `mask` (same size as `overlay`) is provided, only those pixels
+        of `overlay` which are selected by the mask and which are not fully
+        transparent replace the pixels of `img`.
+        """
+        raise NotImplementedError()
+
+    def convert(self, img, mode):
+        """\
+        Returns the image converted into the provided Pillow image mode.
+        """
+        raise NotImplementedError()
+
+    def encode(self, frames, target, ext, durations=None, loop=0):
+        """\
+        Writes the frame(s) into target.
+
+        :param list frames: The frames. If `durations` is ``None``, only the
+                first frame is written.
+        :param target: A filename or a writable file-like object.
+        :param str ext: The image format as file extension (i.e. "png").
+        :param durations: ``None`` or the durations of the frames in milliseconds.
+        :param int loop: Number of loops of an animation (``0``: infinite).
+        """
+        raise NotImplementedError()
+
+
+class PillowBackend(Backend):
+    """\
+    Backend which uses Pillow (default).
+    """
+    name = 'pillow'
+    animation_formats = ('gif', 'png', 'webp')
+
+    def decode(self, background, width, height, animated):
+        bg_img = _load_background(background, width=width, height=height)
+        try:
+            is_animated = animated and bg_img.is_animated
+        except AttributeError:
+            is_animated = False
+        if not is_animated:
+            return [bg_img], bg_img.mode, None, 0
+        # The background may be an image provided by the caller, restore the current frame afterwards
+        current_frame = bg_img.tell()
+        frames = [frame.copy() for frame in ImageSequence.Iterator(bg_img)]
+        bg_img.seek(current_frame)
+        return frames, bg_img.mode, [img.info.get('duration', 0) for img in frames], bg_img.info.get('loop', 0)
+
+    def from_pil(self, img):
+        return img
+
+    def size(self, img):
+        return img.size
+
+    def resize(self, img, size):
+        return img.resize(size, LANCZOS)
+
+    def composite(self, img, overlay, pos, mask=None):
+        img = img.copy()
+        if mask is not None:
+            # Transparent pixels of the overlay keep the pixels of the image
+            opaque = overlay.getchannel('A').point(_OPAQUE_LUT)
+            mask = ImageChops.darker(mask, opaque)
+        img.paste(overlay, pos, mask)
+        return img
+
+    def convert(self, img, mode):
+        return img.convert(mode)
+
+    def encode(self, frames, target, ext, durations=None, loop=0):
+        Image.init()
+        kind = Image.registered_extensions().get('.' + ext, ext)
+        if durations is not None:
+            frames[0].save(target, format=kind, duration=durations, save_all=True, append_images=frames[1:],
+                           loop=loop)
+        else:
+            frames[0].save(target, format=kind)
+
+
+class VipsBackend(Backend):
+    """\
+    Backend which uses libvips (requires pyvips).
+
+    libvips evaluates the operations on demand and in parallel. Filenames,
+    file-like objects and buffers are read through a libvips source and
+    shrunk on load, large (animated) backgrounds are streamed instead of
+    being held in memory completely.
+
+    Backgrounds provided as Image or array are already decoded, they are
+    copied into libvips once. The same applies to the QR code and the
+    mask which are created in memory by Segno / Pillow at the output size.
+    """
+    name = 'vips'
+    animation_formats = ('gif', 'webp')
+
+    def decode(self, background, width, height, animated):
+        if isinstance(background, Image.Image) or hasattr(background, '__array_interface__'):
+            frames, mode, durations, loop = PillowBackend().decode(background, width, height, animated)
+            frames = [self.from_pil(img.convert('RGBA')) for img in frames]
+            return frames, (mode if mode in _VIPS_MODES.values() else 'RGBA'), durations, loop
+        source = _vips_source(background)
+        header = pyvips.Image.new_from_source(source, '')
+        mode = _VIPS_MODES.get(header.bands, 'RGBA')
+        n_pages = _vips_field(header, 'n-pages', 1)
+        options = {}
+        if animated and n_pages > 1:
+            options['option_string'] = 'n=-1'
+        # Shrink-on-load: Decode the background at (about) the required size,
+        # SVG images are rendered at that size, even if they are smaller
+        size = 'both' if 'svgload' in _vips_field(header, 'vips-loader', '') else 'down'
+        img = pyvips.Image.thumbnail_source(source, width, height=height, size=size, **options)
+        # Keep the source (and its callbacks) alive as long as the image is not evaluated
+        img._references.append(source)
+        if img.interpretation not in ('srgb', 'b-w') or img.format != 'uchar':
+            img = img.colourspace('srgb').cast('uchar')
+        if img.interpretation == 'b-w':
+            img = img.colourspace('srgb')
+        if not img.hasalpha():
+            img = img.bandjoin(255)
+        if not animated or n_pages < 2:
+            return [img], mode, None, 0
+        page_height = _vips_field(img, 'page-height', img.height)
+        frames = [img.crop(0, i * page_height, img.width, page_height) for i in range(img.height // page_height)]
+        durations = list(_vips_field(img, 'delay', [0] * len(frames)))
+        return frames, mode, durations, _vips_field(img, 'loop', 0)
+
+    def from_pil(self, img):
+        width, height = img.size
+        bands = len(img.getbands())
+        res = pyvips.Image.new_from_memory(img.tobytes(), width, height, bands, 'uchar')
+        return res.copy(interpretation='srgb' if bands > 2 else 'b-w')
+
+    def size(self, img):
+        return img.width, img.height
+
+    def resize(self, img, size):
+        width, height = size
+        # thumbnail_image premultiplies the alpha channel, like Pillow
+        return img.thumbnail_image(width, height=height, size='force')
+
+    def composite(self, img, overlay, pos, mask=None):
+        x, y = pos
+        if mask is not None:
+            # Transparent pixels of the overlay keep the pixels of the image
+            mask = (overlay[3] > 0) & mask
+            overlay = mask.ifthenelse(overlay, img.crop(x, y, overlay.width, overlay.height))
+        return img.insert(overlay, x, y)
+
+    def convert(self, img, mode):
+        if mode not in _VIPS_MODES.values():
+            raise ValueError('Unsupported image mode "{}" for the libvips backend'.format(mode))
+        if mode in ('L', 'LA'):
+            alpha = img[3]
+            img = img.colourspace('b-w')[0]
+            if mode == 'LA':
+                img = img.bandjoin(alpha)
+        elif mode == 'RGB':
+            img = img[0:3]
+        return img
+
+    def encode(self, frames, target, ext, durations=None, loop=0):
+        img = frames[0]
+        if durations is not None:
+            img = pyvips.Image.arrayjoin(frames, across=1).copy()
+            img.set_type(pyvips.GValue.gint_type, 'page-height', frames[0].height)
+            img.set_type(pyvips.GValue.array_int_type, 'delay', [int(d) for d in durations])
+            img.set_type(pyvips.GValue.gint_type, 'loop', loop)
+        if hasattr(target, 'write'):
+            vips_target = pyvips.TargetCustom()
+            vips_target.on_write(lambda chunk: target.write(chunk) or len(chunk))
+        else:
+            vips_target = pyvips.Target.new_to_file(target)
+        img.write_to_target(vips_target, '.' + ext)
+
+
+def _vips_source(background):
+    """\
+    Returns a pyvips.Source which reads the background on demand.
+
+    :param background: Filename, readable file-like object or bytes-like object.
+    """
+    if isinstance(background, (bytes, bytearray, memoryview)):
+        return pyvips.Source.new_from_memory(_contiguous(background))
+    if not hasattr(background, 'read'):
+        return pyvips.Source.new_from_file(background)
+    source = pyvips.SourceCustom()
+    source.on_read(background.read)
+    if hasattr(background, 'seekable') and background.seekable():
+        # Without a seek handler, libvips treats the source as pipe and caches the content
+        source.on_seek(lambda offset, whence: background.seek(offset, whence))
+    return source
+
+
+def _vips_field(img, name, default):
+    """\
+    Returns the metadata `name` of the libvips image or `default`.
+    """
+    if img.get_typeof(name) == 0:
+        return default
+    return img.get(name)
+
+
+_BACKENDS = {backend.name: backend for backend in (PillowBackend, VipsBackend)}
+_default_backend = PillowBackend()
+
+
+def set_default_backend(backend):
+    """\
+    Sets the backend which is used by `write_artistic` if no backend is
+    provided.
+
+    :param backend: A :py:class:`Backend` instance or the name of a backend
+            ("pillow" or "vips").
+    """
+    global _default_backend
+    _default_backend = _get_backend(backend)
+
+
+def _get_backend(backend):
+    """\
+    Returns a Backend instance.
+
+    :param backend: ``None`` (default backend), the name of a backend or
+            a Backend instance.
+    :rtype: Backend
+    """
+    if backend is None:
+        return _default_backend
+    if isinstance(backend, Backend):
+        return backend
+    try:
+        return _BACKENDS[backend]()
+    except KeyError:
+        raise ValueError('Unknown backend "{}". Supported: {}'.format(backend, ', '.join(sorted(_BACKENDS))))
+
+
+class RenderCache(object):
+    """\
+    Content-addressed on-disk cache of rendered images.
+
+    The images are stored as files in `directory`, the file name is a hash
+    of the QR code matrix, the background and all parameters which affect
+    the rendered image. If the cache exceeds `max_size` bytes, the least
+    recently used files are removed.
+
+    The cache may be shared by several processes, files are written
+    atomically.
+    """
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        """\
+        :param str directory: The cache directory. It is created if it does
+                not exist.
+        :param int max_size: Max. size of the cache in bytes
+                (default: 256 MiB).
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_size = max_size
+        # Estimated size of the cache, determined by the first put
+        self._size = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _touch(self, key):
+        """\
+        Marks the entry as recently used and returns its path or ``None``
+        if the cache does not contain the key.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, key):
+        """\
+        Returns the cached content or ``None`` if the cache does not contain
+        the key.
+
+        :param str key: The cache key.
+        :rtype: bytes or None
+        """
+        path = self._touch(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:  # Removed by another process
+            return None
+
+    def copy(self, key, target):
+        """\
+        Copies the cached content into `target` without decoding it.
+
+        :param str key: The cache key.
+        :param target: A filename or a writable file-like object.
+        :return: ``True`` if the cache contained the key, otherwise ``False``.
+        """
+        path = self._touch(key)
+        if path is None:
+            return False
+        try:
+            if hasattr(target, 'write'):
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, target)
+            else:
+                shutil.copyfile(path, target)
+        except FileNotFoundError:  # Removed by another process
+            return False
+        return True
+
+    def put(self, key, data):
+        """\
+        Stores `data` under the provided key and removes the least recently
+        used entries if the cache exceeds its max. size.
+
+        Content which is larger than the max. size of the cache is not stored.
+
+        :param str key: The cache key.
+        :param bytes data: The content.
+        """
+        if len(data) > self.max_size:
+            return
+        path = self._path(key)
+        try:
+            replaced_size = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=_CACHE_TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if self._size is None:
+            self._evict()
+        else:
+            self._size += len(data) - replaced_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """\
+        Removes the least recently used entries until the cache does not
+        exceed its max. size and updates the size estimate.
+
+        The estimate covers the entries written by this instance only,
+        the directory is scanned whenever the estimate exceeds the max.
+        size.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_CACHE_TMP_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_size:
+                    break
+        self._size = total
+
+
+def _cache_key(qrcode, params, background=None):
+    """\
+    Returns the cache key for the provided QR code, params and background.
+
+    :param segno.QRCode qrcode: The QR code.
+    :param dict params: Parameters which affect the rendered image.
+    :param background: Optional background image (any type accepted by
+            `write_artistic` except file-like objects).
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(repr((qrcode.version, qrcode.symbol_size(scale=1, border=0))).encode('utf-8'))
+    for row in qrcode.matrix:
+        h.update(row)
+    h.update(repr(sorted(params.items())).encode('utf-8'))
+    # Check for Image first, Pillow images provide the array interface as well
+    if not isinstance(background, Image.Image) and hasattr(background, '__array_interface__'):
+        background = Image.fromarray(background)
+    if isinstance(background, Image.Image):
+        current_frame = background.tell()
+        # The current frame is used if the target does not support animations
+        h.update(repr((current_frame, background.info.get('loop'))).encode('utf-8'))
+        for frame in ImageSequence.Iterator(background):
+            h.update(repr((frame.mode, frame.size, frame.getpalette(), frame.info.get('duration'),
+                           frame.info.get('transparency'))).encode('utf-8'))
+            h.update(frame.tobytes())
+        background.seek(current_frame)
+    elif isinstance(background, (bytes, bytearray, memoryview)):
+        h.update(_contiguous(background))
+    elif background is not None:
+        with open(background, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _background_mask(qrcode, scale):
+    """\
+    Returns a mask (mode "L") which indicates which pixels of the QR code
+    (without quiet zone) should be replaced by the background image.
+
+    The mask is created at module granularity and expanded to the pixel
+    resolution afterwards, the matrix is iterated once without scaling.
+
+    :param segno.QRCode qrcode: The QR code.
+    :param int scale: The scale, must be divisible by 3.
+    :return: Image.
+    """
+    width, height = qrcode.symbol_size(scale=1, border=0)
+    # Each module is divided into 3 x 3 cells, the center cell keeps the QR code module
+    replace = (b'\xff\xff\xff', b'\xff\x00\xff', b'\xff\xff\xff')
+    keep = b'\x00\x00\x00'
+    keep_modules = _KEEP_MODULES
+    rows = []
+    for row in qrcode.matrix_iter(scale=1, border=0, verbose=True):
+        row = [m in keep_modules for m in row]
+        rows.extend(b''.join(keep if k else cells for k in row) for cells in replace)
+    mask = Image.frombytes('L', (width * 3, height * 3), b''.join(rows))
+    d = scale // 3
+    if d > 1:
+        mask = mask.resize((width * scale, height * scale), NEAREST)
+    return mask
+
+
+def _load_background(background, width, height):
+    """\
+    Returns the background as PIL.Image
+
+    Already loaded images are returned as they are, objects which support
+    the array interface are converted without decoding them again and
+    buffers are read without copying them.
+
+    :param background: Filename, file-like object, bytes-like object,
+            Image or array.
+    :param width: The max. width of the background (used for SVG images).
+    :param height: The max. height of the background (used for SVG images).
+    :return: Image.
+    """
+    if isinstance(background, Image.Image):
+        return background
+    if hasattr(background, '__array_interface__'):
+        return Image.fromarray(background)
+    if isinstance(background, (bytearray, memoryview)):
+        background = _contiguous(background)
+    if isinstance(background, bytes):
+        # BytesIO shares the buffer of an immutable bytes object
+        background = io.BytesIO(background)
+    elif isinstance(background, (bytearray, memoryview)):
+        background = _BufferReader(background)
+    elif hasattr(background, 'read') and not (hasattr(background, 'seekable') and background.seekable()):
+        # Pillow reads non-seekable streams into memory as well, the SVG fallback needs to seek
+        background = io.BytesIO(background.read())
+    start = background.tell() if hasattr(background, 'read') else None
+    try:
+        return Image.open(background)
+    except UnidentifiedImageError:
+        if start is not None:
+            background.seek(start)
+        return _svg_to_png(background, width=width, height=height)
+
+
+def _contiguous(buff):
+    """\
+    Returns the bytes-like object if it is C-contiguous, otherwise a copy
+    of its content as bytes.
+    """
+    return buff if memoryview(buff).c_contiguous else memoryview(buff).tobytes()
+
+
+class _BufferReader(io.RawIOBase):
+    """\
+    Read-only, seekable file-like object over a C-contiguous bytes-like
+    object which avoids copying the whole buffer (in contrast to io.BytesIO).
+    """
+    def __init__(self, buff):
+        self._buff = memoryview(buff).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self._buff[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._buff)
+        if offset < 0:
+            raise ValueError('Negative seek position {}'.format(offset))
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
 
 
 def _svg_to_png(source, width, height):
     """\
     Converts the SVG source into a PNG and returns a PIL.Image
 
-    :param source: The SVG source.
+    :param source: The SVG source, either a filename or a readable
+            file-like object.
     :param width: The target width.
     :param height: The target height.
     :return: Image.
     """
+    if hasattr(source, 'read'):
+        svg = source.read()
+    else:
+        with open(source, 'rb') as f:
+            svg = f.read()
     out = io.BytesIO()
-    try:
-        source.name
-    except AttributeError:
-        pass
-    with open(source, 'rb') as f:
-        cairosvg.svg2png(file_obj=f, write_to=out)
+    cairosvg.svg2png(bytestring=svg, write_to=out)
     out.seek(0)
     img = Image.open(out)
     svg_width, svg_height = img.size
     ratio = min(width / svg_width, height / svg_height)
     w, h = int(svg_width * ratio), int(svg_height * ratio)
     out = io.BytesIO()
-    with open(source, 'rb') as f:
-        cairosvg.svg2png(file_obj=f, write_to=out, output_width=w, output_height=h)
+    cairosvg.svg2png(bytestring=svg, write_to=out, output_width=w, output_height=h)
     out.seek(0)
     return Image.open(out)
 
 
+if not _VIPS_SUPPORT:
+    class VipsBackend(Backend):  # noqa: F811
+        name = 'vips'
+
+        def __init__(self):
+            raise ValueError('pyvips is required for the libvips backend')
+
+    _BACKENDS['vips'] = VipsBackend
+
+
+if not _NUMPY_SUPPORT:
+    def write_numpy(qrcode, *args, **kw):  # noqa: F811
+        raise ValueError('numpy is required for NumPy support')
+
+    def write_numpy_batch(qrcodes, *args, **kw):  # noqa: F811
+        raise ValueError('numpy is required for NumPy support')
+
+
 if not _SVG_SUPPORT:
     def _svg_to_png(source, width=None, height=None):  # noqa: F811
         raise ValueError('cairosvg is required for SVG support')
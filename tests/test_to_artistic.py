@@ -193,5 +193,395 @@ def test_svg_to_png():
     assert decode(img, content)
 
 
+def test_background_bytes():
+    content = 'Got to get you into my life'
+    qr = segno.make_qr(content)
+    scale = 6
+    width, height = qr.symbol_size(scale=scale)
+    with open(_img_src('sunflower.jpg'), 'rb') as f:
+        data = f.read()
+    # Non-contiguous memoryview
+    interleaved = bytearray(len(data) * 2)
+    interleaved[::2] = data
+    for background in (data, bytearray(data), memoryview(data), memoryview(interleaved)[::2]):
+        out = io.BytesIO()
+        qr.to_artistic(background, out, scale=scale, kind='png')
+        out.seek(0)
+        img = Image.open(out)
+        assert (width, height) == img.size
+        assert decode(img, content)
+
+
+def test_background_file_object():
+    content = 'Here, there and everywhere'
+    qr = segno.make_qr(content)
+    scale = 6
+    width, height = qr.symbol_size(scale=scale)
+    out = io.BytesIO()
+    with open(_img_src('transparency.png'), 'rb') as f:
+        qr.to_artistic(f, out, scale=scale, kind='png')
+    out.seek(0)
+    img = Image.open(out)
+    assert (width, height) == img.size
+    assert decode(img, content)
+
+
+class _NonSeekableReader(io.RawIOBase):
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._stream.readinto(b)
+
+
+@pytest.mark.parametrize('background', [_img_src('sunflower.jpg'), _img_src('animated.gif')])
+def test_background_non_seekable(background):
+    content = 'I\'m only sleeping'
+    qr = segno.make_qr(content)
+    scale = 6
+    width, height = qr.symbol_size(scale=scale)
+    with open(background, 'rb') as f:
+        stream = io.BufferedReader(_NonSeekableReader(f.read()))
+    assert not stream.seekable()
+    out = io.BytesIO()
+    qr.to_artistic(stream, out, scale=scale, kind='png')
+    out.seek(0)
+    img = Image.open(out)
+    assert (width, height) == img.size
+    assert decode(img, content)
+
+
+def test_background_image():
+    content = 'For no one'
+    qr = segno.make_qr(content)
+    scale = 6
+    width, height = qr.symbol_size(scale=scale)
+    bg_img = Image.open(_img_src('transparency.png'))
+    out = io.BytesIO()
+    qr.to_artistic(bg_img, out, scale=scale, kind='png')
+    out.seek(0)
+    img = Image.open(out)
+    assert (width, height) == img.size
+    assert bg_img.mode == img.mode
+    assert decode(img, content)
+    expected = io.BytesIO()
+    qr.to_artistic(_img_src('transparency.png'), expected, scale=scale, kind='png')
+    expected.seek(0)
+    assert Image.open(expected).tobytes() == img.tobytes()
+
+
+def test_background_image_animated():
+    content = 'Yellow Submarine'
+    qr = segno.make_qr(content)
+    bg_img = Image.open(_img_src('animated.gif'))
+    assert bg_img.is_animated
+    out = io.BytesIO()
+    qr.to_artistic(bg_img, out, kind='gif')
+    out.seek(0)
+    res_img = Image.open(out)
+    assert res_img.is_animated
+    assert bg_img.n_frames == res_img.n_frames
+    assert 0 == bg_img.tell()
+
+
+def test_background_array():
+    np = pytest.importorskip('numpy')
+    content = 'Eleanor Rigby'
+    qr = segno.make_qr(content)
+    scale = 6
+    width, height = qr.symbol_size(scale=scale)
+    arr = np.asarray(Image.open(_img_src('sunflower.jpg')))
+    out = io.BytesIO()
+    qr.to_artistic(arr, out, scale=scale, kind='png')
+    out.seek(0)
+    img = Image.open(out)
+    assert (width, height) == img.size
+    assert 'RGB' == img.mode
+    assert decode(img, content)
+
+
+def test_svg_file_object():
+    content = "Ring my friend I said you'd call"
+    qr = segno.make_qr(content)
+    scale = 36
+    width, height = qr.symbol_size(scale=scale)
+    out = io.BytesIO()
+    with open(_img_src('svg-file.svg'), 'rb') as f:
+        qr.to_artistic(f, out, scale=scale, kind='png')
+    out.seek(0)
+    img = Image.open(out)
+    assert (width, height) == img.size
+    assert decode(img, content)
+
+
+@pytest.mark.parametrize('qr, scale', [(segno.make_qr('Penny Lane'), 3),
+                                       (segno.make_qr('Penny Lane' * 10), 6),
+                                       (segno.make_micro('LANE'), 9)])
+def test_background_mask(qr, scale):
+    from segno import consts
+    from qrcode_artistic import _background_mask
+    keep_modules = (consts.TYPE_FINDER_PATTERN_DARK, consts.TYPE_FINDER_PATTERN_LIGHT, consts.TYPE_SEPARATOR,
+                    consts.TYPE_ALIGNMENT_PATTERN_DARK, consts.TYPE_ALIGNMENT_PATTERN_LIGHT, consts.TYPE_TIMING_DARK,
+                    consts.TYPE_TIMING_LIGHT)
+    mask = _background_mask(qr, scale)
+    assert qr.symbol_size(scale=scale, border=0) == mask.size
+    d = scale // 3
+    for y, row in enumerate(qr.matrix_iter(scale=scale, border=0, verbose=True)):
+        for x, m in enumerate(row):
+            replace = m not in keep_modules and not ((y // d) % 3 == 1 and (x // d) % 3 == 1)
+            assert (255 if replace else 0) == mask.getpixel((x, y))
+
+
+@pytest.mark.parametrize('workers', [0, 2, 4])
+def test_animated_workers(workers):
+    content = 'Ring my friend'
+    qr = segno.make_qr(content)
+    scale = 7
+    expected = io.BytesIO()
+    qr.to_artistic(_img_src('animated.gif'), expected, kind='gif', scale=scale)
+    out = io.BytesIO()
+    qr.to_artistic(_img_src('animated.gif'), out, kind='gif', scale=scale, workers=workers)
+    assert expected.getvalue() == out.getvalue()
+    out.seek(0)
+    img = Image.open(out)
+    assert img.is_animated
+    assert decode(img, content)
+
+
+def test_cache(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache_dir = tmp_path / 'cache'
+    cache = RenderCache(str(cache_dir))
+    content = 'Nowhere Man'
+    qr = segno.make_qr(content)
+    expected = io.BytesIO()
+    qr.to_artistic(_img_src('animated.gif'), expected, kind='gif', scale=5)
+    out = io.BytesIO()
+    qr.to_artistic(_img_src('animated.gif'), out, kind='gif', scale=5, cache=cache)
+    assert expected.getvalue() == out.getvalue()
+    assert 1 == len(os.listdir(str(cache_dir)))
+    # Hit, same background provided as bytes
+    with open(_img_src('animated.gif'), 'rb') as f:
+        data = f.read()
+    out = io.BytesIO()
+    qr.to_artistic(data, out, kind='gif', scale=5, cache=cache)
+    assert expected.getvalue() == out.getvalue()
+    assert 1 == len(os.listdir(str(cache_dir)))
+    fn = str(tmp_path / 'out.gif')
+    qr.to_artistic(_img_src('animated.gif'), fn, scale=5, cache=cache)
+    with open(fn, 'rb') as f:
+        assert expected.getvalue() == f.read()
+    assert 1 == len(os.listdir(str(cache_dir)))
+    # Miss: other background / other params
+    qr.to_artistic(_img_src('sunflower.jpg'), io.BytesIO(), kind='gif', scale=5, cache=cache)
+    qr.to_artistic(_img_src('animated.gif'), io.BytesIO(), kind='gif', scale=5, dark='red', cache=cache)
+    assert 3 == len(os.listdir(str(cache_dir)))
+
+
+def test_cache_image(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache_dir = tmp_path / 'cache'
+    cache = RenderCache(str(cache_dir))
+    content = 'Nowhere Man'
+    qr = segno.make_qr(content)
+    expected = io.BytesIO()
+    qr.to_artistic(_img_src('animated.gif'), expected, kind='gif', scale=5)
+    for _ in range(2):
+        out = io.BytesIO()
+        qr.to_artistic(Image.open(_img_src('animated.gif')), out, kind='gif', scale=5, cache=cache)
+        assert expected.getvalue() == out.getvalue()
+        assert 1 == len(os.listdir(str(cache_dir)))
+
+
+def test_cache_array(tmp_path):
+    np = pytest.importorskip('numpy')
+    from qrcode_artistic import RenderCache
+    cache_dir = tmp_path / 'cache'
+    cache = RenderCache(str(cache_dir))
+    qr = segno.make_qr('Nowhere Man')
+    arr = np.asarray(Image.open(_img_src('sunflower.jpg')))
+    expected = io.BytesIO()
+    qr.to_artistic(arr, expected, kind='png', scale=5)
+    for _ in range(2):
+        out = io.BytesIO()
+        qr.to_artistic(arr, out, kind='png', scale=5, cache=cache)
+        assert expected.getvalue() == out.getvalue()
+        assert 1 == len(os.listdir(str(cache_dir)))
+    qr.to_artistic(arr[::-1], io.BytesIO(), kind='png', scale=5, cache=cache)
+    assert 2 == len(os.listdir(str(cache_dir)))
+
+
+def test_cache_image_frame(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache = RenderCache(str(tmp_path / 'cache'))
+    qr = segno.make_qr('Nowhere Man')
+    img = Image.open(_img_src('animated.gif'))
+    for frame in (0, 3):
+        img.seek(frame)
+        expected = io.BytesIO()
+        qr.to_artistic(img, expected, kind='jpeg', scale=5, mode='RGB')
+        img.seek(frame)
+        out = io.BytesIO()
+        qr.to_artistic(img, out, kind='jpeg', scale=5, mode='RGB', cache=cache)
+        assert frame == img.tell()
+        assert expected.getvalue() == out.getvalue()
+    assert 2 == len(os.listdir(str(tmp_path / 'cache')))
+
+
+def test_cache_key_loop():
+    from qrcode_artistic import _cache_key
+    qr = segno.make_qr('Nowhere Man')
+    img1 = Image.open(_img_src('animated.gif'))
+    img2 = Image.open(_img_src('animated.gif'))
+    img2.info['loop'] = img1.info.get('loop', 0) + 1
+    assert _cache_key(qr, {}, img1) != _cache_key(qr, {}, img2)
+
+
+def test_cache_key_palette():
+    from qrcode_artistic import _cache_key
+    qr = segno.make_qr('Nowhere Man')
+    img1 = Image.new('P', (10, 10), 1)
+    img1.putpalette([0, 0, 0, 255, 0, 0])
+    img2 = Image.new('P', (10, 10), 1)
+    img2.putpalette([0, 0, 0, 0, 0, 255])
+    assert img1.tobytes() == img2.tobytes()
+    assert _cache_key(qr, {}, img1) != _cache_key(qr, {}, img2)
+    assert _cache_key(qr, {}, img1) == _cache_key(qr, {}, img1.copy())
+
+
+def test_cache_miss_filename(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache = RenderCache(str(tmp_path / 'cache'))
+    content = 'Taxman'
+    qr = segno.make_qr(content)
+    fn = str(tmp_path / 'out.jpg')
+    qr.to_artistic(_img_src('sunflower.jpg'), fn, scale=6, cache=cache)
+    img = Image.open(fn)
+    assert 'JPEG' == img.format
+    assert qr.symbol_size(scale=6) == img.size
+    assert decode(img, content)
+
+
+def test_cache_eviction(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache_dir = tmp_path / 'cache'
+    cache = RenderCache(str(cache_dir), max_size=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert {'a', 'b'} == set(os.listdir(str(cache_dir)))
+    os.utime(str(cache_dir / 'a'), (1, 1))
+    os.utime(str(cache_dir / 'b'), (2, 2))
+    assert b'12345' == cache.get('a')  # Marks "a" as recently used
+    cache.put('c', b'1')
+    assert {'a', 'c'} == set(os.listdir(str(cache_dir)))
+    assert cache.get('b') is None
+
+
+def test_unknown_backend():
+    qr = segno.make_qr('Michelle')
+    with pytest.raises(ValueError):
+        qr.to_artistic(_img_src('sunflower.jpg'), io.BytesIO(), kind='png', backend='unknown')
+
+
+def test_default_backend():
+    import qrcode_artistic
+    from qrcode_artistic import PillowBackend
+
+    class Backend(PillowBackend):
+        def __init__(self):
+            self.resized = 0
+
+        def resize(self, img, size):
+            self.resized += 1
+            return super(Backend, self).resize(img, size)
+
+    backend = Backend()
+    qr = segno.make_qr('Michelle')
+    qr.to_artistic(_img_src('sunflower.jpg'), io.BytesIO(), kind='png', backend=backend)
+    assert 1 == backend.resized
+    qrcode_artistic.set_default_backend(backend)
+    try:
+        qr.to_artistic(_img_src('sunflower.jpg'), io.BytesIO(), kind='png')
+    finally:
+        qrcode_artistic.set_default_backend('pillow')
+    assert 2 == backend.resized
+
+
+@pytest.mark.parametrize('src, kind, scale, mode', [('sunflower.jpg', 'png', 6, None),
+                                                    ('sunflower.jpg', 'jpg', 7, None),
+                                                    ('sunflower.jpg', 'png', 4, 'L'),
+                                                    ('transparency.png', 'png', 3, None),
+                                                    ('transparency.png', 'png', 5, 'RGB'),
+                                                    ('animated.gif', 'gif', 6, None),
+                                                    ('animated.gif', 'webp', 6, None)])
+@pytest.mark.parametrize('source', ['filename', 'bytes', 'bytearray', 'memoryview', 'file', 'non-seekable',
+                                    'image'])
+def test_vips_backend(src, kind, scale, mode, source):
+    pytest.importorskip('pyvips')
+    from PIL import ImageChops, ImageSequence, ImageStat
+    content = 'And your bird can sing'
+    qr = segno.make_qr(content)
+    expected = io.BytesIO()
+    qr.to_artistic(_img_src(src), expected, kind=kind, scale=scale, mode=mode)
+    expected.seek(0)
+    expected_img = Image.open(expected)
+    with open(_img_src(src), 'rb') as f:
+        data = f.read()
+    background = {'filename': _img_src(src),
+                  'bytes': data,
+                  'bytearray': bytearray(data),
+                  'memoryview': memoryview(data),
+                  'file': io.BytesIO(data),
+                  'non-seekable': io.BufferedReader(_NonSeekableReader(data)),
+                  'image': Image.open(io.BytesIO(data))}[source]
+    out = io.BytesIO()
+    qr.to_artistic(background, out, kind=kind, scale=scale, mode=mode, backend='vips')
+    out.seek(0)
+    img = Image.open(out)
+    assert expected_img.size == img.size
+    assert expected_img.mode == img.mode
+    assert getattr(expected_img, 'n_frames', 1) == getattr(img, 'n_frames', 1)
+    for expected_frame, frame in zip(ImageSequence.Iterator(expected_img), ImageSequence.Iterator(img)):
+        diff = ImageChops.difference(expected_frame.convert('RGB'), frame.convert('RGB'))
+        assert max(ImageStat.Stat(diff).mean) < 5
+    assert decode(img, content)
+
+
+def test_cache_entry_too_large(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache_dir = tmp_path / 'cache'
+    cache = RenderCache(str(cache_dir), max_size=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345678901')
+    assert ['a'] == os.listdir(str(cache_dir))
+    assert cache.get('b') is None
+    assert b'12345' == cache.get('a')
+
+
+def test_cache_eviction_scan(tmp_path, monkeypatch):
+    from qrcode_artistic import RenderCache
+    cache_dir = tmp_path / 'cache'
+    cache = RenderCache(str(cache_dir), max_size=10)
+    scans = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        scans.append(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', counting_scandir)
+    cache.put('a', b'123')
+    assert 1 == len(scans)
+    cache.put('b', b'123')
+    cache.put('a', b'1234')  # Replaces "a"
+    assert 1 == len(scans)
+    cache.put('c', b'1234')
+    assert 2 == len(scans)
+    assert {'a', 'c'} == set(os.listdir(str(cache_dir)))
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2016 - 2023 -- Lars Heuer
+# All rights reserved.
+#
+# License: BSD License
+#
+"""\
+Tests against QRCode.to_numpy
+"""
+import pytest
+import segno
+np = pytest.importorskip('numpy')
+
+
+@pytest.mark.parametrize('kw, mode', [({}, '1'),
+                                      (dict(dark='#333', light='#eee'), 'L'),
+                                      (dict(dark='green', finder_dark='red', data_light='yellow'), 'RGB'),
+                                      (dict(dark='#0000ff80', quiet_zone='blue'), 'RGBA')])
+def test_numpy_like_pil(kw, mode):
+    qr = segno.make_qr('Taxman')
+    scale = 3
+    arr = qr.to_numpy(scale=scale, **kw)
+    assert np.uint8 == arr.dtype
+    expected = np.asarray(qr.to_pil(scale=scale, **kw).convert(mode)).astype(np.uint8)
+    assert expected.shape == arr.shape
+    assert (expected == arr).all()
+
+
+def test_numpy_shape():
+    qr = segno.make_micro('Rain')
+    width, height = qr.symbol_size(scale=2, border=0)
+    assert (height, width) == qr.to_numpy(scale=2, border=0).shape
+    assert (height, width, 3) == qr.to_numpy(scale=2, border=0, mode='RGB').shape
+    assert (height, width, 4) == qr.to_numpy(scale=2, border=0, mode='RGBA').shape
+
+
+def test_numpy_1bit():
+    qr = segno.make_qr('Rain')
+    arr = qr.to_numpy(border=0)
+    assert {0, 1} == set(np.unique(arr))
+    assert 0 == arr[0, 0]  # Dark module of the finder pattern
+
+
+def test_numpy_transparent():
+    qr = segno.make_qr('Rain')
+    arr = qr.to_numpy(light=None)
+    assert 4 == arr.shape[2]
+    expected = np.asarray(qr.to_pil(light=None).convert('RGBA'))
+    assert (expected[..., 3] == arr[..., 3]).all()
+    opaque = arr[..., 3] == 255
+    assert (expected[opaque] == arr[opaque]).all()
+
+
+def test_numpy_out():
+    qr = segno.make_qr('I want to tell you')
+    width, height = qr.symbol_size(scale=4)
+    out = np.zeros((height, width, 3), dtype=np.uint8)
+    res = qr.to_numpy(scale=4, dark='darkred', out=out)
+    assert res is out
+    assert (qr.to_numpy(scale=4, dark='darkred') == out).all()
+
+
+def test_numpy_out_invalid():
+    qr = segno.make_qr('I want to tell you')
+    width, height = qr.symbol_size(scale=4)
+    with pytest.raises(ValueError):
+        qr.to_numpy(scale=4, out=np.zeros((height, width, 3), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        qr.to_numpy(scale=4, out=np.zeros((height, width), dtype=np.int32))
+    with pytest.raises(ValueError):
+        qr.to_numpy(scale=4, out=np.zeros((width, height * 2), dtype=np.uint8)[:, ::2])
+
+
+def test_numpy_invalid_mode():
+    qr = segno.make_qr('Love you to')
+    with pytest.raises(ValueError):
+        qr.to_numpy(mode='P')
+
+
+def test_numpy_batch():
+    from qrcode_artistic import write_numpy_batch
+    qrcodes = [segno.make_qr(content, version=2) for content in ('Revolver', 'Taxman', 'Eleanor Rigby')]
+    arr = write_numpy_batch(qrcodes, scale=2, dark='navy')
+    assert (3,) + qrcodes[0].to_numpy(scale=2, dark='navy').shape == arr.shape
+    assert arr.flags.c_contiguous
+    for qr, a in zip(qrcodes, arr):
+        assert (qr.to_numpy(scale=2, dark='navy') == a).all()
+    out = np.empty_like(arr)
+    assert out is write_numpy_batch(qrcodes, scale=2, dark='navy', out=out)
+    assert (arr == out).all()
+
+
+def test_numpy_batch_different_versions():
+    from qrcode_artistic import write_numpy_batch
+    with pytest.raises(ValueError):
+        write_numpy_batch([segno.make_qr('A', version=1), segno.make_qr('A', version=2)])
+
+
+@pytest.mark.parametrize('kw', [dict(drak='red'), dict(cache=None), dict(finder='red')])
+def test_numpy_batch_unknown_kw(kw):
+    from qrcode_artistic import write_numpy_batch
+    with pytest.raises(TypeError):
+        write_numpy_batch([segno.make_qr('A')], **kw)
+
+
+@pytest.mark.parametrize('color, expected', [('red', (255, 0, 0, 255)),
+                                             ('#f00', (255, 0, 0, 255)),
+                                             ('#f008', (255, 0, 0, 136)),
+                                             ('#ff000080', (255, 0, 0, 128)),
+                                             ('ff0000', (255, 0, 0, 255)),
+                                             ((255, 0, 0), (255, 0, 0, 255)),
+                                             ((255, 0, 0, 128), (255, 0, 0, 128)),
+                                             ((255, 0, 0, .5), (255, 0, 0, 128))])
+def test_numpy_colors(color, expected):
+    qr = segno.make_qr('Good day sunshine')
+    arr = qr.to_numpy(dark=color, light='#fff8', border=0)
+    assert expected == tuple(arr[0, 0])
+    assert (255, 255, 255, 136) == tuple(arr[7, 7])  # Separator
+
+
+@pytest.mark.parametrize('color', ['not-a-color', '#12', (256, 0, 0), (0, 0, 0, 1.5), (0, 0)])
+def test_numpy_invalid_color(color):
+    qr = segno.make_qr('Good day sunshine')
+    with pytest.raises(ValueError):
+        qr.to_numpy(dark=color)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
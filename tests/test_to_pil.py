@@ -9,6 +9,7 @@
 Tests against QRCode.to_pil
 """
 from __future__ import absolute_import
+import os
 import pytest
 import segno
 
@@ -122,5 +123,19 @@ def test_pil_palette_autodetect():
     assert 'transparency' in img.info
 
 
+def test_pil_cache(tmp_path):
+    from qrcode_artistic import RenderCache
+    cache = RenderCache(str(tmp_path))
+    qr = segno.make_qr('A')
+    img = qr.to_pil(scale=2, dark='green', cache=cache)
+    assert 1 == len(os.listdir(str(tmp_path)))
+    cached_img = qr.to_pil(scale=2, dark='green', cache=cache)
+    assert 1 == len(os.listdir(str(tmp_path)))
+    assert img.mode == cached_img.mode
+    assert img.tobytes() == cached_img.tobytes()
+    qr.to_pil(scale=3, dark='green', cache=cache)
+    assert 2 == len(os.listdir(str(tmp_path)))
+
+
 if __name__ == '__main__':
     pytest.main([__file__])